@@ -1,11 +1,24 @@
 import argparse
+import asyncio
+import os
 import socket
-import struct
-import json
-import threading
+import orjson
+from collections import deque
 from datetime import datetime
 from typing import Dict, Any
-from pymongo import MongoClient, errors
+from bson import ObjectId
+from pymongo import InsertOne, errors
+from motor.motor_asyncio import AsyncIOMotorClient
+from wire import FRAME_HEADER, tune_socket, utc_now_iso
+
+try:
+    # uvloop (libuv) is a faster drop-in event loop; it is not available on Windows
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# keys of the generated numeric fields (gen_26 .. gen_150), built once rather than per document
+GEN_KEYS = tuple(f"gen_{i}" for i in range(26, 151))
 
 # ---- helper: parse args ----
 def parse_args():
@@ -15,79 +28,138 @@ def parse_args():
     p.add_argument("--mongo", default="mongodb://localhost:27017", help="MongoDB URI")
     p.add_argument("--db", default="telemetryDB", help="MongoDB database name")
     p.add_argument("--coll", default="telemetryRecords", help="MongoDB collection name")
+    p.add_argument("--workers", type=int, default=1, help="Number of worker processes sharing the port via SO_REUSEPORT")
+    p.add_argument("--max-pool-size", type=int, default=200, help="Max MongoDB connections in the client pool")
+    p.add_argument("--min-pool-size", type=int, default=32, help="MongoDB connections kept open in the client pool")
+    p.add_argument("--flush-size", type=int, default=200, help="Flush a connection's buffered inserts once this many are queued")
+    p.add_argument("--flush-ms", type=float, default=50.0, help="Flush a connection's buffered inserts at most this long after the first is queued (milliseconds, > 0)")
+    p.add_argument("--w", type=int, default=0, help="MongoDB write concern for inserts (0 = unacknowledged, fastest; 1 = wait for the primary)")
     return p.parse_args()
 
 # ---- simple processing function (placeholder) ----
 def process_document(doc: Dict[str, Any]) -> Dict[str, Any]:
     # Example: compute number and average of numeric generated fields
-    nums = [v for k, v in doc.items() if k.startswith("gen_") and isinstance(v, (int, float))]
-    s = sum(nums) if nums else 0
-    avg = (s / len(nums)) if nums else None
-    return {"numeric_count": len(nums), "numeric_sum": s, "numeric_avg": avg}
-
-# ---- socket framing helpers ----
-def recv_exact(sock: socket.socket, n: int) -> bytes:
-    """Receive exactly n bytes from socket or raise."""
-    buf = b""
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
-            raise ConnectionError("Socket closed while reading")
-        buf += chunk
-    return buf
-
-def handle_client(conn: socket.socket, addr, db_coll):
+    nums = [v for k in GEN_KEYS if isinstance((v := doc.get(k)), (int, float))]
+    n = len(nums)
+    s = sum(nums)
+    return {"numeric_count": n, "numeric_sum": s, "numeric_avg": s / n if n else None}
+
+# ---- batched inserts ----
+async def flush_inserts(pending: deque, db_coll, addr) -> bool:
+    """Write all buffered InsertOne ops for one connection in a single bulk_write; False if it failed."""
+    if not pending:
+        return True
+    ops = list(pending)
+    pending.clear()
+    try:
+        await db_coll.bulk_write(ops, ordered=False)
+    except Exception as e:
+        print(f"[mongo] bulk write of {len(ops)} docs from {addr} failed: {e}")
+        return False
+    return True
+
+async def delayed_flush(pending: deque, db_coll, addr, interval: float):
+    # frames that arrive while a write is in flight find this task still running and don't arm
+    # their own timer, so keep going until a write leaves the buffer empty
+    while True:
+        await asyncio.sleep(interval)
+        await flush_inserts(pending, db_coll, addr)
+        if not pending:
+            return
+
+# ---- per-connection handler ----
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, db_coll, flush_size: int,
+                        flush_interval: float, ack_after_write: bool):
+    addr = writer.get_extra_info("peername")
     print(f"[conn] Accepted from {addr}")
+    tune_socket(writer.get_extra_info("socket"))
+    # inserts are buffered per connection and written with bulk_write by size, or by a timer task that
+    # runs only while the buffer is non-empty (so idle connections never wake up).
+    # With an acknowledged write concern each frame is written before its ack instead.
+    pending = deque()
+    flusher = None
     try:
         while True:
-            # read 4-byte big-endian length
-            header = conn.recv(4)
-            if not header:
-                print(f"[conn] {addr} closed connection")
-                break
-            if len(header) < 4:
-                # try to read exact 4 bytes
-                header += recv_exact(conn, 4 - len(header))
-            msglen = struct.unpack(">I", header)[0]
+            # read 8-byte big-endian (length, seq) header
+            try:
+                header = await reader.readexactly(FRAME_HEADER.size)
+            except asyncio.IncompleteReadError as e:
+                if not e.partial:
+                    print(f"[conn] {addr} closed connection")
+                    break
+                raise ConnectionError("Socket closed while reading")
+            msglen, seq = FRAME_HEADER.unpack(header)
             # read payload
-            payload = recv_exact(conn, msglen)
             try:
-                doc = json.loads(payload.decode("utf-8"))
+                payload = await reader.readexactly(msglen)
+            except asyncio.IncompleteReadError:
+                raise ConnectionError("Socket closed while reading")
+            try:
+                msg = orjson.loads(payload)
             except Exception as e:
                 # send back an error response
                 err = {"status": "error", "reason": f"invalid json: {e}"}
-                send_response(conn, err)
+                await send_response(writer, err, seq)
                 continue
 
-            # add server-side metadata
-            doc["_receivedAt"] = datetime.utcnow().isoformat()
+            # a frame carries one document, or a JSON array of documents from a batching producer;
+            # either way it gets a single ack
+            batched = isinstance(msg, list)
+            docs = msg if batched else [msg]
+            received_at = utc_now_iso()
 
-            # insert into MongoDB (safe single insert)
+            # queue for MongoDB; the _id is assigned here so the ack can carry it before the batch is written
             try:
-                insert_result = db_coll.insert_one(doc)
-                # optionally process and update the document with processing result
-                proc_res = process_document(doc)
-                db_coll.update_one({"_id": insert_result.inserted_id}, {"$set": {"_processed": True, "_processedAt": datetime.utcnow(), "_processingResult": proc_res}})
-                ack = {"status": "ok", "id": str(insert_result.inserted_id)}
+                ops = []
+                for doc in docs:
+                    # add server-side metadata
+                    doc["_receivedAt"] = received_at
+                    # process before inserting so the document is written once, already carrying its result
+                    proc_res = process_document(doc)
+                    doc["_id"] = ObjectId()
+                    doc["_processed"] = True
+                    doc["_processedAt"] = datetime.utcnow()
+                    doc["_processingResult"] = proc_res
+                    ops.append(InsertOne(doc))
+                # a frame is queued whole or not at all, so an error ack never leaves part of it behind
+                pending.extend(ops)
+                if ack_after_write or len(pending) >= flush_size:
+                    if not await flush_inserts(pending, db_coll, addr) and ack_after_write:
+                        raise errors.PyMongoError("bulk write failed")
+                elif pending and (flusher is None or flusher.done()):
+                    flusher = asyncio.create_task(delayed_flush(pending, db_coll, addr, flush_interval))
+                if batched:
+                    ack = {"status": "ok", "count": len(docs), "ids": [str(d["_id"]) for d in docs]}
+                else:
+                    ack = {"status": "ok", "id": str(docs[0]["_id"])}
             except Exception as e:
                 ack = {"status": "error", "reason": str(e)}
 
-            send_response(conn, ack)
+            await send_response(writer, ack, seq)
     except ConnectionError as ce:
         print(f"[conn] connection error from {addr}: {ce}")
     except Exception as ex:
         print(f"[conn] unexpected error from {addr}: {ex}")
-        conn.close()
+    finally:
+        # a still-armed timer finds the buffer empty when it fires
+        await flush_inserts(pending, db_coll, addr)
+        writer.close()
 
-def send_response(conn: socket.socket, obj: dict):
-    b = json.dumps(obj, default=str).encode("utf-8")
-    header = struct.pack(">I", len(b))
-    conn.sendall(header + b)
+async def send_response(writer: asyncio.StreamWriter, obj: dict, seq: int):
+    b = orjson.dumps(obj)
+    header = FRAME_HEADER.pack(len(b), seq)
+    # hand header and payload to the transport separately instead of concatenating them
+    writer.writelines((header, b))
+    await writer.drain()
 
-def main():
-    args = parse_args()
+async def serve(args):
+    # the motor client is created inside each worker so it binds to that worker's event loop
     try:
-        client = MongoClient(args.mongo)
+        # --w 0 (the default) lets producers be acked once their docs are queued; otherwise each frame waits for its write
+        client = AsyncIOMotorClient(
+            args.mongo, w=args.w, compressors="zstd,snappy", retryWrites=True,
+            maxPoolSize=args.max_pool_size, minPoolSize=args.min_pool_size,
+        )
         db = client[args.db]
         coll = db[args.coll]
         print(f"[mongo] connected to {args.mongo} DB:{args.db} Coll:{args.coll}")
@@ -95,31 +167,51 @@ def main():
         print("[mongo] connection error:", e)
         return
 
-    # start TCP server
-    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    srv.bind((args.host, args.port))
-    srv.listen(8)
-    # srv.settimeout(10)
-    print(f"[tcp] consumer listening on {args.host}:{args.port} ...")
+    # with --workers > 1 every worker binds the same port and SO_REUSEPORT lets the kernel spread new connections
+    # across their accept queues; a single worker leaves it off so a second consumer on the port fails to bind
+    srv = await asyncio.start_server(
+        lambda r, w: handle_client(r, w, coll, max(1, args.flush_size), args.flush_ms / 1000.0, args.w != 0),
+        args.host, args.port,
+        reuse_address=True,
+        reuse_port=args.workers > 1,
+    )
+    print(f"[tcp] consumer (pid {os.getpid()}) listening on {args.host}:{args.port} ...")
+    try:
+        async with srv:
+            await srv.serve_forever()
+    finally:
+        client.close()
 
+def run_worker(args):
     try:
-        while True:
-            conn, addr = srv.accept()
-            # handle each client in a separate thread
-            t = threading.Thread(target=handle_client, args=(conn, addr, coll), daemon=True)
-            t.start()
-            
+        if uvloop is not None:
+            uvloop.run(serve(args))
+        else:
+            asyncio.run(serve(args))
     except KeyboardInterrupt:
-        print("[tcp] shutting down (KeyboardInterrupt)")
-        srv.close()
-        client.close()
-    except :
-        srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        srv.bind((args.host, args.port))
-        srv.listen(8)
-        srv.settimeout(10)      
+        print(f"[tcp] shutting down (KeyboardInterrupt) pid {os.getpid()}")
+
+def main():
+    args = parse_args()
+    if args.flush_ms <= 0:
+        raise SystemExit("--flush-ms must be > 0")
+    if args.workers > 1 and not (hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")):
+        raise SystemExit("--workers > 1 requires os.fork and SO_REUSEPORT (Linux/BSD)")
+
+    children = []
+    for _ in range(args.workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(args)
+            os._exit(0)
+        children.append(pid)
+
+    run_worker(args)
+    for pid in children:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,29 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
+import os
 import socket
-import struct
-import json
+import orjson
 import threading
-import queue
+from collections import deque
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Dict, Any
 from pymongo import MongoClient, errors
-from flask import Flask, Response, stream_with_context
+import uvicorn
+from sse_starlette.sse import EventSourceResponse, ServerSentEvent
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from wire import recv_frame, send_payload, tune_socket, utc_now_iso
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# generated field names (gen_26 .. gen_150) that process_document sums
+GEN_KEYS = tuple(f"gen_{i}" for i in range(26, 151))
 
 # ----------------- your original helpers & logic (kept) -----------------
 def parse_args():
@@ -18,140 +33,227 @@ def parse_args():
     p.add_argument("--mongo", default="mongodb://localhost:27017", help="MongoDB URI (use replicaSet=rs0 for change streams)")
     p.add_argument("--db", default="telemetryDB", help="MongoDB database name")
     p.add_argument("--coll", default="telemetryRecords", help="MongoDB collection name")
+    p.add_argument("--w", type=int, default=0, help="MongoDB write concern for inserts (0 = unacknowledged, fastest; 1 = wait for the primary)")
+    p.add_argument("--max-pool-size", type=int, default=200, help="Max MongoDB connections in the client pool")
+    p.add_argument("--min-pool-size", type=int, default=32, help="MongoDB connections kept open in the client pool")
+    p.add_argument("--resume-token-file", default=".watcher_resume_token", help="File where the change-stream resume token is persisted")
+    p.add_argument("--resume-token-every", type=int, default=100, help="Persist the resume token every N change events")
     p.add_argument("--http-host", default="0.0.0.0", help="Host for embedded HTTP server (SSE)")
     p.add_argument("--http-port", type=int, default=8000, help="Port for embedded HTTP server (SSE)")
     return p.parse_args()
 
 def process_document(doc: Dict[str, Any]) -> Dict[str, Any]:
-    nums = [v for k, v in doc.items() if k.startswith("gen_") and isinstance(v, (int, float))]
-    s = sum(nums) if nums else 0
-    avg = (s / len(nums)) if nums else None
-    return {"numeric_count": len(nums), "numeric_sum": s, "numeric_avg": avg}
-
-def recv_exact(sock: socket.socket, n: int) -> bytes:
-    buf = b""
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
-            raise ConnectionError("Socket closed while reading")
-        buf += chunk
-    return buf
-
-def send_response(conn: socket.socket, obj: dict):
-    b = json.dumps(obj, default=str).encode("utf-8")
-    header = struct.pack(">I", len(b))
-    conn.sendall(header + b)
+    nums = [v for k in GEN_KEYS if isinstance((v := doc.get(k)), (int, float))]
+    n = len(nums)
+    s = sum(nums)
+    return {"numeric_count": n, "numeric_sum": s, "numeric_avg": s / n if n else None}
+
+def send_response(conn: socket.socket, obj: dict, seq: int):
+    send_payload(conn, orjson.dumps(obj), seq)
 
 # ----------------- Broadcasting (SSE) primitives -----------------
-# Each connected HTTP client gets a Queue that mongo_watcher will put messages into.
-clients = set()
+# Each connected HTTP client gets a bounded ring buffer that mongo_watcher appends messages to.
+class SSEClient:
+    __slots__ = ("buf", "wakeup")
+
+    def __init__(self, maxlen: int = 200):
+        # deque.append is atomic, so the watcher thread can fill it without a lock;
+        # when full the oldest event is dropped
+        self.buf = deque(maxlen=maxlen)
+        self.wakeup = asyncio.Event()
+
+# Copy-on-write snapshot of connected clients: replaced (never mutated) on subscribe/unsubscribe,
+# so broadcasting reads it without taking clients_lock.
+clients = ()
 clients_lock = threading.Lock()
+# event loop of the HTTP server; set once uvicorn starts the app
+http_loop = None
 
-def broadcast_to_clients(data_str: str):
-    """Put a message into each client's queue (non-blocking)."""
+def subscribe(client: SSEClient):
+    global clients
     with clients_lock:
-        for q in list(clients):
-            try:
-                q.put_nowait(data_str)
-            except Exception:
-                # if queue full or error, ignore that client for now
-                pass
+        clients = clients + (client,)
+
+def unsubscribe(client: SSEClient):
+    global clients
+    with clients_lock:
+        clients = tuple(c for c in clients if c is not client)
+
+def wake_clients(snapshot):
+    for c in snapshot:
+        c.wakeup.set()
+
+def broadcast_to_clients(data_str: str):
+    """Append a message to each client's buffer and wake them with a single loop callback."""
+    snapshot = clients
+    if not snapshot:
+        return
+    for c in snapshot:
+        c.buf.append(data_str)
+    if http_loop is not None:
+        http_loop.call_soon_threadsafe(wake_clients, snapshot)
 
 # ----------------- MongoDB watcher thread -----------------
-def mongo_watcher(coll):
+# only inserts are broadcast; filtering server-side keeps update events (e.g. _processed) off the wire
+WATCH_PIPELINE = [{"$match": {"operationType": {"$in": ["insert"]}}}]
+
+# server error codes meaning the saved token can't be resumed from: InvalidResumeToken,
+# ChangeStreamFatalError (token no longer in the oplog) and ChangeStreamHistoryLost
+RESUME_TOKEN_ERRORS = (260, 280, 286)
+
+def load_resume_token(path: str):
+    try:
+        with open(path, "rb") as fh:
+            return orjson.loads(fh.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
+
+def save_resume_token(path: str, token):
+    # write then rename so a crash never leaves a truncated token behind
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(orjson.dumps(token, default=str))
+    os.replace(tmp, path)
+
+def discard_resume_token(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def mongo_watcher(coll, token_path: str, save_every: int = 100):
     """
-    Uses MongoDB Change Streams to watch for changes and broadcasts JSON events.
+    Uses MongoDB Change Streams to watch for inserts and broadcasts JSON events.
+    The resume token is persisted to token_path so a restart continues where it left off
+    instead of replaying or missing the oplog window.
     NOTE: Requires MongoDB replica set (even single-node). See run instructions.
     """
+    token = load_resume_token(token_path)
+    seen = 0
+    opened = False
     try:
-        print("[watcher] starting change stream...")
-        # full_document='updateLookup' gives the full updated doc for update events
-        with coll.watch(full_document='updateLookup') as stream:
+        print(f"[watcher] starting change stream (resuming: {token is not None})...")
+        # insert events always carry fullDocument, so no full_document lookup option is needed
+        try:
+            stream = coll.watch(WATCH_PIPELINE, resume_after=token)
+        except errors.OperationFailure as e:
+            if token is None or e.code not in RESUME_TOKEN_ERRORS:
+                raise
+            print(f"[watcher] saved resume token is no longer usable ({e}); starting from now")
+            discard_resume_token(token_path)
+            token = None
+            stream = coll.watch(WATCH_PIPELINE)
+        opened = True
+        with stream:
             for change in stream:
                 # change contains operationType, fullDocument (if requested), ns, documentKey, etc.
-                data = json.dumps(change, default=str)
+                data = orjson.dumps(change, default=str).decode("utf-8")
                 print("[watcher] change:", data)
                 broadcast_to_clients(data)
+                token = change["_id"]
+                seen += 1
+                if seen % save_every == 0:
+                    save_resume_token(token_path, token)
+    except errors.OperationFailure as e:
+        print("[watcher] error (change-stream):", e)
+        if e.code in RESUME_TOKEN_ERRORS:
+            # the stream fell off the oplog; a saved token would fail the same way on restart
+            discard_resume_token(token_path)
+            token = None
     except Exception as e:
         print("[watcher] error (change-stream):", e)
         # In production you might want to retry with backoff here.
+    finally:
+        # nothing new to persist if the stream never opened
+        if opened and token is not None:
+            save_resume_token(token_path, token)
 
-# ----------------- Embedded Flask SSE server -----------------
-app = Flask(__name__)
-
-@app.route("/events")
-def sse_events():
+# ----------------- Embedded ASGI SSE server -----------------
+async def sse_events(request):
     """SSE endpoint: frontend connects and receives Mongo change events."""
-    q = queue.Queue(maxsize=200)
-    with clients_lock:
-        clients.add(q)
+    client = SSEClient()
+    subscribe(client)
 
-    def gen():
+    async def gen():
         try:
             # SSE initial comment to confirm connection
-            yield ": connected\n\n"
+            yield ServerSentEvent(comment="connected")
             while True:
-                # block until an event arrives
-                data = q.get()
-                # SSE requires lines starting with 'data: ' and double newline termination
-                yield f"data: {data}\n\n"
-        except GeneratorExit:
-            # client disconnected
-            return
+                while client.buf:
+                    yield ServerSentEvent(data=client.buf.popleft())
+                # clear before re-checking so an append racing with us still wakes us up
+                client.wakeup.clear()
+                if not client.buf:
+                    # wait (without holding a thread) until an event arrives
+                    await client.wakeup.wait()
         finally:
-            with clients_lock:
-                clients.discard(q)
+            # client disconnected
+            unsubscribe(client)
+
+    return EventSourceResponse(gen())
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
 
-    return Response(stream_with_context(gen()), mimetype="text/event-stream")
+@asynccontextmanager
+async def lifespan(app):
+    global http_loop
+    http_loop = asyncio.get_running_loop()
+    yield
 
-@app.route("/health")
-def health():
-    return {"status": "ok"}
+app = Starlette(routes=[Route("/events", sse_events), Route("/health", health)], lifespan=lifespan)
 
-def run_flask(host: str, port: int):
-    # Simple builtin Flask server for dev/demo. For production run behind nginx/uwsgi/gunicorn.
-    print(f"[http] starting Flask SSE server on {host}:{port}")
-    app.run(host=host, port=port, threaded=True, use_reloader=False)
+def run_http(host: str, port: int):
+    # all SSE subscribers share this single event loop instead of one thread each
+    print(f"[http] starting ASGI SSE server on {host}:{port}")
+    uvicorn.run(app, host=host, port=port, loop="uvloop" if uvloop is not None else "asyncio")
 
 # ----------------- Your TCP handler (kept) -----------------
 def handle_client(conn: socket.socket, addr, db_coll):
     print(f"[conn] Accepted from {addr}")
     try:
         while True:
-            # read 4-byte big-endian length
-            header = conn.recv(4)
-            if not header:
+            frame = recv_frame(conn)
+            if frame is None:
                 print(f"[conn] {addr} closed connection")
                 break
-            if len(header) < 4:
-                header += recv_exact(conn, 4 - len(header))
-            msglen = struct.unpack(">I", header)[0]
-            # read payload
-            payload = recv_exact(conn, msglen)
+            seq, payload = frame
             try:
-                doc = json.loads(payload.decode("utf-8"))
+                msg = orjson.loads(payload)
             except Exception as e:
                 err = {"status": "error", "reason": f"invalid json: {e}"}
-                send_response(conn, err)
+                send_response(conn, err, seq)
                 continue
 
-            # add server-side metadata
-            doc["_receivedAt"] = datetime.utcnow().isoformat()
+            # a frame carries one document, or a JSON array of documents from a batching producer;
+            # either way it gets a single ack
+            batched = isinstance(msg, list)
+            docs = msg if batched else [msg]
+            received_at = utc_now_iso()
 
-            # insert into MongoDB (safe single insert)
+            # insert into MongoDB (single insert, or one insert_many per batch)
             try:
-                insert_result = db_coll.insert_one(doc)
-                # optionally process and update the document with processing result
-                proc_res = process_document(doc)
-                db_coll.update_one(
-                    {"_id": insert_result.inserted_id},
-                    {"$set": {"_processed": True, "_processedAt": datetime.utcnow(), "_processingResult": proc_res}}
-                )
-                ack = {"status": "ok", "id": str(insert_result.inserted_id)}
+                for doc in docs:
+                    # add server-side metadata
+                    doc["_receivedAt"] = received_at
+                    # process before inserting so the document is written once, already carrying its result;
+                    # this also means one change-stream event per message, with the result included
+                    proc_res = process_document(doc)
+                    doc["_processed"] = True
+                    doc["_processedAt"] = datetime.utcnow()
+                    doc["_processingResult"] = proc_res
+                if not batched:
+                    insert_result = db_coll.insert_one(docs[0])
+                    ack = {"status": "ok", "id": str(insert_result.inserted_id)}
+                elif docs:
+                    insert_result = db_coll.insert_many(docs, ordered=False)
+                    ack = {"status": "ok", "count": len(docs), "ids": [str(i) for i in insert_result.inserted_ids]}
+                else:
+                    ack = {"status": "ok", "count": 0, "ids": []}
             except Exception as e:
                 ack = {"status": "error", "reason": str(e)}
 
-            send_response(conn, ack)
+            send_response(conn, ack, seq)
     except ConnectionError as ce:
         print(f"[conn] connection error from {addr}: {ce}")
     except Exception as ex:
@@ -169,7 +271,11 @@ def main():
     # Connect to MongoDB
     try:
         # NOTE: change streams require replica set. Use e.g. mongodb://localhost:27017/?replicaSet=rs0
-        client = MongoClient(args.mongo)
+        # the pool is sized so concurrent handle_client threads don't queue on connection checkout
+        client = MongoClient(
+            args.mongo, w=args.w, compressors="zstd,snappy", retryWrites=True,
+            maxPoolSize=args.max_pool_size, minPoolSize=args.min_pool_size,
+        )
         db = client[args.db]
         coll = db[args.coll]
         print(f"[mongo] connected to {args.mongo} DB:{args.db} Coll:{args.coll}")
@@ -178,11 +284,11 @@ def main():
         return
 
     # Start Mongo watcher thread
-    t_watch = threading.Thread(target=mongo_watcher, args=(coll,), daemon=True)
+    t_watch = threading.Thread(target=mongo_watcher, args=(coll, args.resume_token_file, max(1, args.resume_token_every)), daemon=True)
     t_watch.start()
 
-    # Start embedded Flask SSE server in a background thread
-    t_http = threading.Thread(target=run_flask, args=(args.http_host, args.http_port), daemon=True)
+    # Start embedded ASGI SSE server in a background thread
+    t_http = threading.Thread(target=run_http, args=(args.http_host, args.http_port), daemon=True)
     t_http.start()
 
     # Start TCP server (your original accept loop)
@@ -195,6 +301,7 @@ def main():
     try:
         while True:
             conn, addr = srv.accept()
+            tune_socket(conn)
             t = threading.Thread(target=handle_client, args=(conn, addr, coll), daemon=True)
             t.start()
     except KeyboardInterrupt:
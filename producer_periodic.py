@@ -1,13 +1,14 @@
 import argparse
+import csv
 import socket
-import struct
-import json
+import sys
+import orjson
 import random
 import time
-from datetime import datetime
 from typing import Dict, List, Tuple, Optional
-import pandas as pd
+import numpy as np
 from faker import Faker
+from wire import recv_frame, send_payload, tune_socket, utc_now_iso
 
 faker = Faker()
 
@@ -38,56 +39,112 @@ def parse_args():
     p.add_argument("--reconnect-backoff", type=float, default=1.0, help="Initial reconnect backoff seconds (exponential)")
     return p.parse_args()
 
-def random_value_for_col(col_index: int):
+# ---- synthetic values ----
+# Each generated column gets a fixed value type, drawn once; text comes from pools of
+# pre-generated faker output so steady-state generation makes no faker calls.
+INT, FLOAT, BOOL, TEXT = range(4)
+GEN_KEYS = tuple(sys.intern(f"gen_{i}") for i in range(26, 151))
+WORD_POOL: List[str] = []
+SENT_POOL: List[str] = []
+COL_TYPES: Dict[int, int] = {}
+# gen_ keys grouped by column type, so numeric columns can be drawn for a whole batch at once
+GEN_KEYS_BY_TYPE: Dict[int, List[str]] = {INT: [], FLOAT: [], BOOL: [], TEXT: []}
+rng = np.random.default_rng()
+
+def random_text() -> str:
+    return random.choice(WORD_POOL) if random.random() < 0.6 else random.choice(SENT_POOL)
+
+VALUE_GENERATORS = {
+    INT: lambda: random.randint(0, 10000),
+    FLOAT: lambda: round(random.uniform(-1000.0, 10000.0), 4),
+    BOOL: lambda: random.random() < 0.5,
+    TEXT: random_text,
+}
+
+def init_generators(seed: Optional[int] = None, n_words: int = 10000, n_sentences: int = 2000):
+    """Pre-generate faker text and fix the gen_ column types; call after seeding so runs stay reproducible."""
+    global rng
+    rng = np.random.default_rng(seed)
+    WORD_POOL[:] = [faker.word() for _ in range(n_words)]
+    SENT_POOL[:] = [faker.sentence(nb_words=random.randint(2, 5)) for _ in range(n_sentences)]
+    for keys in GEN_KEYS_BY_TYPE.values():
+        keys.clear()
+    for i, k in zip(range(26, 151), GEN_KEYS):
+        GEN_KEYS_BY_TYPE[col_type_for(i)].append(k)
+
+def draw_col_type() -> int:
     t = random.random()
     if t < 0.25:
-        return random.randint(0, 10000)
+        return INT
     elif t < 0.55:
-        return round(random.uniform(-1000.0, 10000.0), 4)
+        return FLOAT
     elif t < 0.75:
-        return random.choice([True, False])
-    else:
-        return faker.word() if random.random() < 0.6 else faker.sentence(nb_words=random.randint(2, 5))
+        return BOOL
+    return TEXT
+
+def col_type_for(col_index: int) -> int:
+    col_type = COL_TYPES.get(col_index)
+    if col_type is None:
+        col_type = COL_TYPES[col_index] = draw_col_type()
+    return col_type
+
+def random_value_for_col(col_index: int):
+    return VALUE_GENERATORS[col_type_for(col_index)]()
+
+def build_generated_batch(n: int) -> List[dict]:
+    """Generated fields for n documents; numeric columns come from one numpy draw per type."""
+    int_keys, float_keys, bool_keys, text_keys = (GEN_KEYS_BY_TYPE[t] for t in (INT, FLOAT, BOOL, TEXT))
+    # .tolist() hands back plain Python int/float/bool, which orjson and BSON encode natively
+    ints = rng.integers(0, 10001, (n, len(int_keys))).tolist()
+    floats = rng.uniform(-1000.0, 10000.0, (n, len(float_keys))).round(4).tolist()
+    bools = (rng.random((n, len(bool_keys))) < 0.5).tolist()
+    batch = []
+    for i in range(n):
+        # start from the ordered key template so documents keep gen_26 .. gen_150 order
+        fields = dict.fromkeys(GEN_KEYS)
+        fields.update(zip(int_keys, ints[i]))
+        fields.update(zip(float_keys, floats[i]))
+        fields.update(zip(bool_keys, bools[i]))
+        for k in text_keys:
+            fields[k] = random_text()
+        batch.append(fields)
+    return batch
+
+def country_city_pairs(mapping: Dict[str, List[str]]) -> Tuple[Tuple[str, str], ...]:
+    """Flatten {country: [cities]} once so picking a location is a single random.choice."""
+    return tuple((country, city) for country, cities in mapping.items() for city in (cities or [""]))
 
-def build_generated_fields():
-    return {f"gen_{i}": random_value_for_col(i) for i in range(26, 151)}
+COUNTRY_CITY_PAIRS = country_city_pairs(DEFAULT_COUNTRIES)
 
-def pick_country_city(mapping=DEFAULT_COUNTRIES):
-    country = random.choice(list(mapping.keys()))
-    city = random.choice(mapping[country]) if mapping[country] else ""
-    return country, city
+def pick_country_city(pairs=COUNTRY_CITY_PAIRS):
+    return random.choice(pairs)
 
-def send_frame(sock: socket.socket, obj: dict):
-    b = json.dumps(obj, default=str).encode("utf-8")
-    header = struct.pack(">I", len(b))
-    sock.sendall(header + b)
+def send_frame(sock: socket.socket, obj: dict, seq: int = 0):
+    # sends are stop-and-wait here, so the sequence number is informational only
+    send_payload(sock, orjson.dumps(obj), seq)
 
-def recv_frame(sock: socket.socket) -> dict:
-    header = sock.recv(4)
-    if not header:
+def recv_ack(sock: socket.socket) -> dict:
+    frame = recv_frame(sock)
+    if frame is None:
         raise ConnectionError("connection closed by server")
-    if len(header) < 4:
-        # read remaining bytes
-        needed = 4 - len(header)
-        header += sock.recv(needed)
-    msglen = struct.unpack(">I", header)[0]
-    data = b""
-    while len(data) < msglen:
-        chunk = sock.recv(msglen - len(data))
-        if not chunk:
-            raise ConnectionError("server closed mid-frame")
-        data += chunk
-    return json.loads(data.decode("utf-8"))
+    return orjson.loads(frame[1])
 
 def load_csv_rows(file_path: str):
-    df = pd.read_csv(file_path, dtype=str, keep_default_na=False)
-    if df.shape[1] < 25:
-        raise SystemExit(f"CSV has {df.shape[1]} columns; at least 25 required")
-    header = list(df.columns)
-    # store only first-25 values per row to build doc at runtime
-    rows = []
-    for _, r in df.iterrows():
-        rows.append([None if r[header[i]] == "" else r[header[i]] for i in range(25)])
+    # values are kept as strings, so the stdlib reader is enough (utf-8-sig drops a leading BOM)
+    with open(file_path, newline="", encoding="utf-8-sig") as fh:
+        reader = csv.reader(fh)
+        header = next(reader, [])
+        if len(header) < 25:
+            raise SystemExit(f"CSV has {len(header)} columns; at least 25 required")
+        # store only first-25 values per row to build doc at runtime
+        rows = []
+        for r in reader:
+            if not r:
+                continue
+            r = r[:25]
+            if len(r) < 25:
+                r += [""] * (25 - len(r))
+            rows.append([None if v == "" else v for v in r])
     return header[:25], rows
 
 def connect_with_backoff(host: str, port: int, initial_backoff: float = 1.0, max_backoff: float = 60.0):
@@ -98,6 +155,7 @@ def connect_with_backoff(host: str, port: int, initial_backoff: float = 1.0, max
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.settimeout(10)
             sock.connect((host, port))
+            tune_socket(sock)
             connectedd = True
             sock.settimeout(None)  # switch to blocking mode
             return sock
@@ -111,6 +169,7 @@ def main():
     if args.seed is not None:
         random.seed(args.seed)
         Faker.seed(args.seed)
+    init_generators(args.seed)
 
     if args.mode == "csv" and not args.file:
         raise SystemExit("mode=csv requires --file path")
@@ -134,7 +193,7 @@ def main():
         while True:
             start_time = time.time()
             batch_to_send = []
-            for _ in range(args.batch):
+            for gen_fields in build_generated_batch(args.batch):
                 if args.mode == "csv":
                     if total_rows == 0:
                         raise SystemExit("CSV has no rows")
@@ -149,17 +208,17 @@ def main():
                 else:
                     doc = {f"col{i+1}": random_value_for_col(i+1) for i in range(25)}
 
-                doc.update(build_generated_fields())
+                doc.update(gen_fields)
                 country, city = pick_country_city()
                 doc["country"] = country
                 doc["city"] = city
-                doc["_ingestedAt"] = datetime.utcnow().isoformat()
+                doc["_ingestedAt"] = utc_now_iso()
                 batch_to_send.append(doc)
             for doc in batch_to_send:
                 try:
                     send_frame(sock, doc)
                     if args.ack:
-                        ack = recv_frame(sock)
+                        ack = recv_ack(sock)
                         if ack.get("status") != "ok":
                             print(f"[warn] non-ok ack: {ack}")
                     sent_total += 1
@@ -170,7 +229,7 @@ def main():
                     try:
                         send_frame(sock, doc)
                         if args.ack:
-                            ack = recv_frame(sock)
+                            ack = recv_ack(sock)
                         sent_total += 1
                     except Exception as e2:
                         print(f"[tcp] resend failed: {e2}. Skipping this doc.")
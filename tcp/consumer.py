@@ -5,6 +5,8 @@ import argparse
 from typing import Any, Dict, List
 from pymongo import MongoClient, UpdateOne
 
+GEN_KEYS = tuple(f"gen_{i}" for i in range(26, 151))
+
 def parse_args():
     p = argparse.ArgumentParser()
     p.add_argument('--mongo', '-m', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017'),
@@ -16,7 +18,7 @@ def parse_args():
     p.add_argument('--batch', type=int, default=200,
                    help='Number of docs to process per loop (default 200)')
     p.add_argument('--poll', type=float, default=5.0,
-                   help='Poll interval in seconds when no docs found (default 5s)')
+                   help='Max seconds to wait for new inserts before flushing a partial batch (default 5s)')
     return p.parse_args()
 
 def to_number(v):
@@ -36,19 +38,50 @@ def to_number(v):
             return None
 
 def process_document(doc: Dict[str, Any]) -> Dict[str, Any]:
-    numeric_values = []
-    for k, v in doc.items():
-        if k.startswith("gen_"):
-            num = to_number(v)
-            if num is not None:
-                numeric_values.append(num)
-    if numeric_values:
-        s = sum(numeric_values)
-        avg = s / len(numeric_values)
-    else:
-        s = 0
-        avg = None
-    return {"numeric_count": len(numeric_values), "numeric_sum": s, "numeric_avg": avg}
+    # to_number returns ints/floats as-is, so numbers straight from the producer skip its string parsing
+    nums = [num for k in GEN_KEYS if (num := to_number(doc.get(k))) is not None]
+    n = len(nums)
+    s = sum(nums)
+    return {"numeric_count": n, "numeric_sum": s, "numeric_avg": s / n if n else None}
+
+# new unprocessed documents, delivered by the change stream (insert events always carry fullDocument)
+WATCH_PIPELINE = [{"$match": {"operationType": "insert", "fullDocument._processed": False}}]
+
+def flush(coll, docs: List[Dict[str, Any]]):
+    print(f"found {len(docs)} document(s) to process")
+    updates = []
+    for doc in docs:
+        try:
+            result = process_document(doc)
+            updates.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {
+                    "_processed": True,
+                    "_updatedAt": datetime.utcnow(),
+                    "_processingResult": result
+                }}
+            ))
+        except Exception as e:
+            updates.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {
+                    "_processingError": str(e),
+                    "_processingErrorAt": datetime.utcnow()
+                }}
+            ))
+    if updates:
+        res = coll.bulk_write(updates, ordered=False)
+        print(f"bulk write completed: matched {res.matched_count}, modified {res.modified_count}")
+
+def catch_up(coll, batch: int):
+    """Process documents inserted while the consumer was not running."""
+    # documents that already failed are skipped so this pass always terminates
+    query = {'_processed': False, '_processingError': {'$exists': False}}
+    while True:
+        docs = list(coll.find(query).limit(batch))
+        if not docs:
+            return
+        flush(coll, docs)
 
 def main():
     args = parse_args()
@@ -57,35 +90,26 @@ def main():
     coll = db[args.coll]
     print(f"consumer connected to {args.mongo} with database: {args.db} and collection: {args.coll}")
     try:
-        while True:
-            docs = list(coll.find({'_processed': False}).limit(args.batch))
-            if not docs:
-                time.sleep(args.poll)
-                continue
-            print(f"found {len(docs)} document(s) to process")
-            updates = []
-            for doc in docs:
-                try:
-                    result = process_document(doc)
-                    updates.append(UpdateOne(
-                        {"_id": doc["_id"]},
-                        {"$set": {
-                            "_processed": True,
-                            "_updatedAt": datetime.utcnow(),
-                            "_processingResult": result
-                        }}
-                    ))
-                except Exception as e:
-                    updates.append(UpdateOne(
-                        {"_id": doc["_id"]},
-                        {"$set": {
-                            "_processingError": str(e),
-                            "_processingErrorAt": datetime.utcnow()
-                        }}
-                    ))
-            if updates:
-                res = coll.bulk_write(updates, ordered=False)
-                print(f"bulk write completed: matched {res.matched_count}, modified {res.modified_count}")
+        # NOTE: change streams require a replica set (even single-node).
+        # The stream is opened before the catch-up scan so inserts made during it are not missed.
+        with coll.watch(WATCH_PIPELINE, max_await_time_ms=int(args.poll * 1000)) as stream:
+            catch_up(coll, args.batch)
+            buf = []
+            # monotonic time the oldest buffered doc arrived; a partial batch is flushed once it is
+            # args.poll old, even if a slow trickle of events keeps try_next from ever timing out
+            first_at = 0.0
+            while stream.alive:
+                # try_next returns None once max_await_time_ms passes without an event
+                change = stream.try_next()
+                if change is not None:
+                    if not buf:
+                        first_at = time.monotonic()
+                    buf.append(change["fullDocument"])
+                    if len(buf) < args.batch and time.monotonic() - first_at < args.poll:
+                        continue
+                if buf:
+                    flush(coll, buf)
+                    buf = []
     except KeyboardInterrupt:
         print("consumer stopped by user")
     finally:
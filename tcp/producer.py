@@ -1,10 +1,10 @@
 import os
+import csv
 import random
 import time
 import argparse
 from typing import Dict, List, Tuple
 from datetime import datetime
-import pandas as pd
 from pymongo import MongoClient
 from faker import Faker
 
@@ -36,6 +36,8 @@ def parse_arg():
                    help='MongoDB collection name')
     p.add_argument('--batch', type=int, default=500,
                    help='Insert batch size (default 500)')
+    p.add_argument('--w', type=int, default=0,
+                   help='MongoDB write concern for inserts (0 = unacknowledged, fastest; 1 = wait for the primary)')
     p.add_argument('--seed', type=int, default=None,
                    help='Optional random seed for reproducibility (default none)')
     p.add_argument('--countries-file', type=str, default=None,
@@ -52,11 +54,14 @@ def load_country(country_file: str = None) -> Dict[str, List[str]]:
             raise ValueError("file must contain a JSON object mapping country -> list of cities")
     return DEFAULT_COUNTRIES
 
-def pick_country_city(mapping: Dict[str, List[str]]) -> Tuple[str, str]:
-    country = random.choice(list(mapping.keys()))
-    cities = mapping[country]
-    city = random.choice(cities)
-    return country, city
+def country_table(mapping: Dict[str, List[str]]) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    """(country, cities) pairs built once, so picking a location doesn't rebuild the key list per document."""
+    return tuple((country, tuple(cities)) for country, cities in mapping.items())
+
+def pick_country_city(table: Tuple[Tuple[str, Tuple[str, ...]], ...]) -> Tuple[str, str]:
+    # uniform over countries, then over that country's cities
+    country, cities = random.choice(table)
+    return country, random.choice(cities)
 
 def random_value(col_index: int):
     t = random.random()
@@ -87,19 +92,23 @@ def main():
     countries_map = load_country(args.countries_file)
     for k in list(countries_map.keys())[:10]:
         print(f"{k}: {countries_map[k][:5]}")
+    locations = country_table(countries_map)
 
     csv_path = args.file
     if not csv_path or not os.path.exists(csv_path):
         raise SystemExit(f"CSV file not found: {csv_path}")
     print(f"reading the file {csv_path} ...")
-    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
-    ncols = df.shape[1]
-    if ncols < 25:
-        raise SystemExit(f"your data has only {ncols} columns. number of columns should be >= 25")
-    csv_header = list(df.columns)
+    with open(csv_path, newline="", encoding="utf-8-sig") as fh:
+        reader = csv.reader(fh)
+        csv_header = next(reader, [])
+        ncols = len(csv_header)
+        if ncols < 25:
+            raise SystemExit(f"your data has only {ncols} columns. number of columns should be >= 25")
+        # short rows are padded so every doc keeps all 25 keys (missing cells become None)
+        rows = [(r + [""] * (25 - len(r)))[:25] for r in reader if r]
     print(f"csv detected {ncols} columns; first 25 columns (required): {csv_header[:25]}")
 
-    client = MongoClient(args.mongo)
+    client = MongoClient(args.mongo, w=args.w, compressors="zstd,snappy")
     db = client[args.db]
     coll = db[args.coll]
     print(f"connected to MongoDB {args.mongo}, DB: {args.db}, collection: {args.coll}")
@@ -107,14 +116,10 @@ def main():
     total = 0
     batch_doc = []
     batch_size = max(1, args.batch)
-    for idx, row in df.iterrows():
-        doc = {}
-        for i in range(25):
-            key = csv_header[i]
-            val = row[key]
-            doc[key] = None if val == "" else val
+    for row in rows:
+        doc = {key: (None if val == "" else val) for key, val in zip(csv_header[:25], row)}
         doc.update(build_generated_fields())
-        country, city = pick_country_city(countries_map)
+        country, city = pick_country_city(locations)
         doc["country"] = country
         doc["city"] = city
         doc["_ingestedAt"] = datetime.utcnow()
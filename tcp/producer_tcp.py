@@ -1,12 +1,20 @@
 import argparse
+import csv
+import os
+import queue
 import socket
-import struct
-import json
+import sys
+import threading
+import orjson
 import random
-from datetime import datetime
-from typing import Dict, List, Tuple
-import pandas as pd
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
 from faker import Faker
+
+# the shared wire module lives at the repo root, one level above this script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wire import recv_frame, send_payload, set_quickack, utc_now_iso
+
 faker = Faker()
 DEFAULT_COUNTRIES = {
     "India": ["Mumbai", "Delhi", "Bengaluru", "Kolkata", "Chennai"],
@@ -21,6 +29,15 @@ DEFAULT_COUNTRIES = {
     "Japan": ["Tokyo", "Osaka", "Kyoto", "Yokohama", "Nagoya"]
 }
 
+# generated field keys gen_26 .. gen_150, built once instead of per row
+GEN_KEYS = tuple(sys.intern(f"gen_{i}") for i in range(26, 151))
+# rows of generated fields drawn per numpy call
+GEN_BLOCK = 1024
+rng = np.random.default_rng()
+# faker output generated once at startup and sampled per cell (see init_text_pools)
+WORD_POOL: List[str] = []
+SENT_POOL: List[str] = []
+
 def parse_args():
     p = argparse.ArgumentParser()
     p.add_argument("--file", "-f", required=True, help="CSV file path")
@@ -28,109 +45,198 @@ def parse_args():
     p.add_argument("--port", type=int, default=5000, help="Consumer port")
     p.add_argument("--seed", type=int, default=None, help="Optional RNG seed")
     p.add_argument("--batch", type=int, default=1, help="Send N docs per ack (1 = ack per doc)")
+    p.add_argument("--window", type=int, default=8, help="Max frames sent before waiting for the oldest ack (1 = stop-and-wait)")
     return p.parse_args()
 
-def random_value_for_col(col_index: int):
-    t = random.random()
-    if t < 0.25:
-        return random.randint(0, 10000)
-    elif t < 0.55:
-        return round(random.uniform(-1000.0, 10000.0), 4)
-    elif t < 0.75:
-        return random.choice([True, False])
-    else:
-        if random.random() < 0.6:
-            return faker.word()
-        return faker.sentence(nb_words=random.randint(2, 5))
-
-def build_generated_fields():
-    return {f"gen_{i}": random_value_for_col(i) for i in range(26, 151)}
-
-def pick_country_city(mapping):
-    country = random.choice(list(mapping.keys()))
-    city = random.choice(mapping[country]) if mapping[country] else ""
-    return country, city
-
-def send_frame(sock: socket.socket, obj: dict):
-    b = json.dumps(obj, default=str).encode("utf-8")
-    header = struct.pack(">I", len(b))
-    sock.sendall(header + b)
-
-def recv_frame(sock: socket.socket):
-    # read 4 bytes
-    header = sock.recv(4)
-    if not header:
+def init_text_pools(n_words: int = 5000, n_sentences: int = 5000):
+    """Pre-generate faker text; call after seeding so runs stay reproducible."""
+    WORD_POOL[:] = [faker.word() for _ in range(n_words)]
+    SENT_POOL[:] = [faker.sentence(nb_words=random.randint(2, 5)) for _ in range(n_sentences)]
+
+def random_text() -> str:
+    if random.random() < 0.6:
+        return random.choice(WORD_POOL)
+    return random.choice(SENT_POOL)
+
+def build_generated_rows(n: int) -> List[list]:
+    """Generated values for n rows, in GEN_KEYS order; every numeric cell is drawn by numpy, only text cells loop in Python."""
+    shape = (n, len(GEN_KEYS))
+    # per cell: 25% int, 30% float, 20% bool, 25% text
+    types = rng.random(shape)
+    values = np.empty(shape, dtype=object)
+    # casting into the object array stores plain Python int/float/bool
+    values[:] = rng.integers(0, 10001, shape)
+    floats = types >= 0.25
+    values[floats] = rng.uniform(-1000.0, 10000.0, shape).round(4)[floats]
+    bools = types >= 0.55
+    values[bools] = (rng.random(shape) < 0.5)[bools]
+    for r, c in zip(*np.nonzero(types >= 0.75)):
+        values[r, c] = random_text()
+    return values.tolist()
+
+def generated_rows_stream() -> Iterator[list]:
+    """Endless stream of generated-value rows, drawn GEN_BLOCK rows at a time."""
+    while True:
+        yield from build_generated_rows(GEN_BLOCK)
+
+def country_city_pairs(mapping: Dict[str, List[str]]) -> Tuple[Tuple[str, str], ...]:
+    """Flatten {country: [cities]} once so picking a location is a single random.choice."""
+    return tuple((country, city) for country, cities in mapping.items() for city in (cities or [""]))
+
+COUNTRY_CITY_PAIRS = country_city_pairs(DEFAULT_COUNTRIES)
+
+def pick_country_city(pairs=COUNTRY_CITY_PAIRS):
+    return random.choice(pairs)
+
+def recv_ack(sock: socket.socket) -> Tuple[int, dict]:
+    """Read one ack frame; returns (seq, decoded payload)."""
+    frame = recv_frame(sock)
+    if frame is None:
         raise ConnectionError("server closed")
-    if len(header) < 4:
-        # get remaining
-        header += sock.recv(4 - len(header))
-    msglen = struct.unpack(">I", header)[0]
-    data = b""
-    while len(data) < msglen:
-        chunk = sock.recv(msglen - len(data))
-        if not chunk:
-            raise ConnectionError("server closed mid-frame")
-        data += chunk
-    return json.loads(data.decode("utf-8"))
+    set_quickack(sock)
+    seq, data = frame
+    return seq, orjson.loads(data)
+
+def encode_batch(docs: List[dict]) -> bytes:
+    """Docs as one frame payload: a JSON array, or a lone doc as a plain object.
+
+    The whole list goes through a single orjson.dumps call, so the per-doc loop runs in orjson's
+    native code rather than as one Python-level call per doc.
+    """
+    # documents only hold str/None/int/float/bool, all native to orjson, so no default= fallback runs per value
+    return orjson.dumps(docs if len(docs) > 1 else docs[0])
+
+def send_batch(sock: socket.socket, payload: bytes, count: int, seq: int, inflight: Dict[int, int], window: int):
+    """Send one batch frame of `count` docs that gets a single ack.
+
+    Up to `window` frames stay unacknowledged; whenever the window is full the next ack is read
+    first. Acks carry the seq of their frame, so they are matched by seq rather than by order.
+    """
+    while len(inflight) >= window:
+        drain_ack(sock, inflight)
+    send_payload(sock, payload, seq)
+    inflight[seq] = count
+
+def drain_ack(sock: socket.socket, inflight: Dict[int, int]):
+    """Read one ack and retire the in-flight frame it names."""
+    seq, ack = recv_ack(sock)
+    if inflight.pop(seq, None) is None:
+        print(f"[warn] ack for unknown frame seq={seq}: {ack}")
+    if ack.get("status") != "ok":
+        print(f"[warn] server ack error (seq={seq}): {ack}")
+
+def csv_rows(reader) -> Iterator[List[str]]:
+    """Yield each non-blank CSV row padded to at least 25 cells."""
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < 25:
+            row += [""] * (25 - len(row))
+        yield row
+
+def make_doc_builder(header: List[str]):
+    """Compile build_doc(row, gen, country, city, ts) for this CSV header.
+
+    The document shape is fixed once the header is known (25 CSV columns, the GEN_KEYS values,
+    then country/city/_ingestedAt), so the function body is a single straight-line dict literal
+    rather than a loop of per-key inserts. Empty CSV cells become None.
+    """
+    items = [f"{key!r}: row[{i}] or None" for i, key in enumerate(header[:25])]
+    items += [f"{key!r}: gen[{i}]" for i, key in enumerate(GEN_KEYS)]
+    items += ["'country': country", "'city': city", "'_ingestedAt': ts"]
+    src = "def build_doc(row, gen, country, city, ts):\n    return {" + ", ".join(items) + "}\n"
+    namespace = {}
+    exec(compile(src, "<build_doc>", "exec"), namespace)
+    return namespace["build_doc"]
+
+def generate_frames(reader, build_doc, batch: int, frames: queue.Queue, errors: list):
+    """Generator thread: CSV rows -> docs -> encoded batch payloads, put on `frames` as (payload, count).
+
+    A None sentinel is always put last; anything raised is left in `errors` for the sender to re-raise.
+    """
+    batch_buf = []
+    try:
+        for row, gen in zip(csv_rows(reader), generated_rows_stream()):
+            country, city = pick_country_city()
+            batch_buf.append(build_doc(row, gen, country, city, utc_now_iso()))
+
+            if len(batch_buf) >= batch:
+                # whole batch in one frame, one ack
+                frames.put((encode_batch(batch_buf), len(batch_buf)))
+                batch_buf = []
+
+        # remainder
+        if batch_buf:
+            frames.put((encode_batch(batch_buf), len(batch_buf)))
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        frames.put(None)
 
 def main():
     args = parse_args()
+    global rng
     if args.seed is not None:
         random.seed(args.seed)
         Faker.seed(args.seed)
-
-    countries_map = DEFAULT_COUNTRIES
-
-    df = pd.read_csv(args.file, dtype=str, keep_default_na=False)
-    ncols = df.shape[1]
-    if ncols < 25:
-        raise SystemExit(f"CSV has {ncols} columns; at least 25 required")
-    csv_header = list(df.columns)
+    rng = np.random.default_rng(args.seed)
+    init_text_pools()
+
+    # rows are streamed from the file as they are sent, so memory stays flat and the first frame
+    # goes out without waiting for the whole CSV to parse (utf-8-sig drops a leading BOM)
+    fh = open(args.file, newline="", encoding="utf-8-sig")
+    reader = csv.reader(fh)
+    header = next(reader, [])
+    if len(header) < 25:
+        fh.close()
+        raise SystemExit(f"CSV has {len(header)} columns; at least 25 required")
+    build_doc = make_doc_builder(header)
 
     # connect to server
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.connect((args.host, args.port))
+    # disable Nagle so each pipelined frame goes out immediately instead of waiting on an outstanding ACK
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # room for a whole batch frame in the kernel so sendall rarely blocks mid-frame
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+    set_quickack(sock)
     print(f"[tcp] connected to {args.host}:{args.port}")
 
+    batch = max(1, args.batch)
+    # doc generation/encoding runs in its own thread and this one only sends and reads acks. Only the
+    # blocking socket calls release the GIL (orjson holds it while encoding), so the overlap is generation
+    # running while the sender waits on the network, not parallel encoding. The queue holds ~1024 docs
+    # worth of frames to bound memory
+    frames = queue.Queue(maxsize=max(2, 1024 // batch))
+    errors = []
+    threading.Thread(target=generate_frames, args=(reader, build_doc, batch, frames, errors), daemon=True).start()
+
     sent = 0
-    batch_buf = []
+    # seq -> doc count of frames sent but not yet acked
+    inflight: Dict[int, int] = {}
+    seq = 0
+    window = max(1, args.window)
     try:
-        for  row in df.iterrows():
-            doc = {}
-            for i in range(25):
-                key = csv_header[i]
-                doc[key] = None if row[key] == "" else row[key]
-
-            doc.update(build_generated_fields())
-            country, city = pick_country_city(countries_map)
-            doc["country"] = country
-            doc["city"] = city
-            doc["_ingestedAt"] = datetime.utcnow().isoformat()
-
-            batch_buf.append(doc)
-
-            if len(batch_buf) >= args.batch:
-                # send batch as single array or send one by one: here we send one-by-one
-                for item in batch_buf:
-                    send_frame(sock, item)
-                    # wait for ack per message
-                    ack = recv_frame(sock)
-                    if ack.get("status") != "ok":
-                        print(f"[warn] server ack error: {ack}")
-                sent += len(batch_buf)
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            payload, count = item
+            send_batch(sock, payload, count, seq, inflight, window)
+            # the header field is 32 bits wide
+            seq = (seq + 1) & 0xFFFFFFFF
+            sent += count
+            if count == batch:
                 print(f"[tcp] sent {sent} documents")
-                batch_buf = []
-
-        # send remainder
-        for item in batch_buf:
-            send_frame(sock, item)
-            ack = recv_frame(sock)
-            if ack.get("status") != "ok":
-                print(f"[warn] server ack error: {ack}")
-            sent += 1
+        if errors:
+            raise errors[0]
+        # wait for the acks still outstanding
+        while inflight:
+            drain_ack(sock, inflight)
         print(f"[tcp] finished. total sent: {sent}")
     finally:
         sock.close()
+        fh.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,100 @@
+"""Wire protocol and socket helpers shared by the TCP producers and consumers.
+
+Every frame is an 8-byte big-endian header (payload length, sequence number) followed by a JSON
+payload. A consumer echoes the sequence number of each frame in the header of its ack, so a
+pipelining producer can match acks to frames.
+"""
+import socket
+import struct
+import threading
+import time
+from typing import Optional, Tuple
+
+# frame header, compiled once: payload length, then the sender's sequence number
+FRAME_HEADER = struct.Struct(">II")
+
+# socket.sendmsg (vectored send) is not available on Windows
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+# kernel send/receive buffer size for data connections
+SOCK_BUF_BYTES = 4 << 20
+
+def tune_socket(sock: socket.socket):
+    """Disable Nagle (frames are small and ack-gated) and enlarge the kernel socket buffers."""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCK_BUF_BYTES)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_BUF_BYTES)
+
+def set_quickack(sock: socket.socket):
+    # Linux only; the kernel clears TCP_QUICKACK again after it sends an ACK, so it is re-armed after every read
+    if hasattr(socket, "TCP_QUICKACK"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+# per-thread scratch buffers: frames are packed into `buf` when they can't be sent with sendmsg,
+# and headers are read into `hdr`
+_tls = threading.local()
+
+def pack_frame(payload: bytes, seq: int) -> memoryview:
+    """Frame header + payload laid out in this thread's reusable scratch buffer."""
+    h = FRAME_HEADER.size
+    n = len(payload) + h
+    buf = getattr(_tls, "buf", None)
+    if buf is None or len(buf) < n:
+        buf = _tls.buf = bytearray(max(n, 65536))
+    FRAME_HEADER.pack_into(buf, 0, len(payload), seq)
+    buf[h:n] = payload
+    return memoryview(buf)[:n]
+
+def send_payload(sock: socket.socket, payload: bytes, seq: int):
+    """Send already-encoded JSON as one frame tagged with `seq`."""
+    if not HAS_SENDMSG:
+        sock.sendall(pack_frame(payload, seq))
+        return
+    header = FRAME_HEADER.pack(len(payload), seq)
+    # gather header and payload in one syscall without concatenating them
+    sent = sock.sendmsg((header, payload))
+    if sent < len(header) + len(payload):
+        sock.sendall(pack_frame(payload, seq)[sent:])
+
+def recv_exact(sock: socket.socket, n: int) -> bytearray:
+    # fill one preallocated buffer in place instead of concatenating chunks
+    buf = bytearray(n)
+    view = memoryview(buf)
+    off = 0
+    while off < n:
+        r = sock.recv_into(view[off:])
+        if not r:
+            raise ConnectionError("Socket closed while reading")
+        off += r
+    return buf
+
+def recv_frame(sock: socket.socket) -> Optional[Tuple[int, bytearray]]:
+    """Read one frame as (seq, payload); None if the peer closed the connection between frames."""
+    hdr = getattr(_tls, "hdr", None)
+    if hdr is None:
+        hdr = _tls.hdr = memoryview(bytearray(FRAME_HEADER.size))
+    # the header can arrive split over any number of reads
+    n = 0
+    while n < FRAME_HEADER.size:
+        r = sock.recv_into(hdr[n:], FRAME_HEADER.size - n)
+        if not r:
+            if n == 0:
+                return None
+            raise ConnectionError("Socket closed mid-frame")
+        n += r
+    msglen, seq = FRAME_HEADER.unpack(hdr)
+    return seq, recv_exact(sock, msglen)
+
+# (epoch second, "YYYY-MM-DDTHH:MM:SS") for the current second, replaced as one tuple
+_ts_cache = (0, "")
+
+def utc_now_iso() -> str:
+    """Same string as datetime.utcnow().isoformat(), formatting the date/time part only once per second."""
+    global _ts_cache
+    now = time.time()
+    sec = int(now)
+    cached_sec, prefix = _ts_cache
+    if sec != cached_sec:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+        _ts_cache = (sec, prefix)
+    return f"{prefix}.{int((now - sec) * 1e6):06d}"